@@ -1,132 +1,217 @@
 from abc import ABC, abstractmethod
+from bisect import bisect_left
+import mmap
+import os
+import re
+import stat
 import sys
 
 
+class TokenType:
+    LEFT_PAREN = 0
+    RIGHT_PAREN = 1
+    LEFT_BRACE = 2
+    RIGHT_BRACE = 3
+    COMMA = 4
+    DOT = 5
+    MINUS = 6
+    PLUS = 7
+    SEMICOLON = 8
+    SLASH = 9
+    STAR = 10
+    BANG = 11
+    BANG_EQUAL = 12
+    EQUAL = 13
+    EQUAL_EQUAL = 14
+    GREATER = 15
+    GREATER_EQUAL = 16
+    LESS = 17
+    LESS_EQUAL = 18
+    IDENTIFIER = 19
+    STRING = 20
+    NUMBER = 21
+    AND = 22
+    CLASS = 23
+    ELSE = 24
+    FALSE = 25
+    FUN = 26
+    FOR = 27
+    IF = 28
+    NIL = 29
+    OR = 30
+    PRINT = 31
+    RETURN = 32
+    SUPER = 33
+    THIS = 34
+    TRUE = 35
+    VAR = 36
+    WHILE = 37
+    EOF = 38
+
+
+# indexed by token type
+TOKEN_TYPE_NAMES = tuple(sorted((name for name in vars(TokenType) if not name.startswith("__")), key=lambda name: getattr(TokenType, name)))
+
+
 class Token:
+    __slots__ = ("type", "lexeme", "literal", "text")
+
     def __init__(self, type, lexeme, literal):
         self.type = type
         self.lexeme = lexeme
         self.literal = literal
+        self.text = None
 
     def __repr__(self) -> str:
-        return f"{self.type} {self.lexeme} {"null" if self.literal is None else self.literal}"
-
-ENVIRONMENT = {}
+        # pooled tokens recur throughout a listing, so each one is formatted once
+        text = self.text
+        if text is None:
+            text = self.text = "%s %s %s" % (TOKEN_TYPE_NAMES[self.type], self.lexeme, "null" if self.literal is None else self.literal)
+        return text
+
+GLOBALS = {}
+
+# one list of slots per block being executed, innermost last; locals are resolved to (depth, slot) by the parser
+FRAMES = []
+
+# tokens with a fixed lexeme carry no position, so one shared instance serves every occurrence
+FIXED_TOKENS = {
+    b"(": Token(TokenType.LEFT_PAREN, "(", None),
+    b")": Token(TokenType.RIGHT_PAREN, ")", None),
+    b"{": Token(TokenType.LEFT_BRACE, "{", None),
+    b"}": Token(TokenType.RIGHT_BRACE, "}", None),
+    b"*": Token(TokenType.STAR, "*", None),
+    b".": Token(TokenType.DOT, ".", None),
+    b",": Token(TokenType.COMMA, ",", None),
+    b"+": Token(TokenType.PLUS, "+", None),
+    b"-": Token(TokenType.MINUS, "-", None),
+    b";": Token(TokenType.SEMICOLON, ";", None),
+    b"/": Token(TokenType.SLASH, "/", None),
+    b"=": Token(TokenType.EQUAL, "=", None),
+    b"==": Token(TokenType.EQUAL_EQUAL, "==", None),
+    b"!": Token(TokenType.BANG, "!", None),
+    b"!=": Token(TokenType.BANG_EQUAL, "!=", None),
+    b"<": Token(TokenType.LESS, "<", None),
+    b"<=": Token(TokenType.LESS_EQUAL, "<=", None),
+    b">": Token(TokenType.GREATER, ">", None),
+    b">=": Token(TokenType.GREATER_EQUAL, ">=", None),
+}
+
+EOF_TOKEN = Token(TokenType.EOF, "", None)
+
+KEYWORDS = {
+    "and": TokenType.AND,
+    "class": TokenType.CLASS,
+    "else": TokenType.ELSE,
+    "false": TokenType.FALSE,
+    "for": TokenType.FOR,
+    "fun": TokenType.FUN,
+    "if": TokenType.IF,
+    "nil": TokenType.NIL,
+    "or": TokenType.OR,
+    "print": TokenType.PRINT,
+    "return": TokenType.RETURN,
+    "super": TokenType.SUPER,
+    "this": TokenType.THIS,
+    "true": TokenType.TRUE,
+    "var": TokenType.VAR,
+    "while": TokenType.WHILE,
+}
+
+for keyword, keyword_type in KEYWORDS.items():
+    FIXED_TOKENS[keyword.encode("ascii")] = Token(keyword_type, keyword, None)
+
+# the whole lexical grammar as one regex, so findall() splits the source into lexemes in C:
+# skip whitespace and comments (possessively, so a trailing comment is never re-split), then
+# capture an identifier, a number (a fractional part needs a digit after the dot, so "42." is
+# NUMBER then DOT), a string (possibly unterminated), an operator, or one utf-8 character.
+# Alternatives are tried in order of how often they start a token in typical source, so the
+# engine usually stops at the first or second branch.
+# Trailing whitespace and comments are matched up to an empty lexeme at the end of input,
+# rather than being retried from every position after the last token.
+TOKEN_PATTERN = re.compile(rb"""(?:[ \t\r\f\n]++|//[^\n]*+)*+(
+    [A-Za-z_][A-Za-z0-9_]*+
+    | [(){};,.+\-*/]
+    | [0-9]++(?:\.[0-9]+)?
+    | [!=<>]=?
+    | "[^"]*+"?
+    | [\x80-\xff][\x80-\xbf]*+
+    | [^ \t\r\f\n]
+    | \Z
+)""", re.VERBOSE)
+
+NEWLINE = re.compile(rb"\n")
+
+IDENTIFIER_START = frozenset(b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_")
+DIGITS = frozenset(b"0123456789")
 
 class Scanner:
     def __init__(self, source_code) -> None:
-        self.source_code = source_code
-        self.current = 0
-        self.line = 1
+        # scanning works on raw utf-8 bytes; lexemes are decoded only when first seen
+        self.source_code = source_code.encode("utf-8") if isinstance(source_code, str) else source_code
         self.had_error = False
+        # offsets of every newline, built on the first error; line numbers are only needed to report one
+        self.newline_positions = None
+        # one shared token per distinct lexeme, seeded with the operators and reserved words;
+        # lexemes that are errors map to None
+        self.lexeme_tokens = dict(FIXED_TOKENS)
         
     def scan(self):
-        tokens = []
+        lexemes = TOKEN_PATTERN.findall(self.source_code)
+        # drop the empty end-of-input lexemes: when trailing whitespace or a comment is skipped
+        # by a match whose lexeme is empty, findall retries at the end of input and matches again
+        while lexemes and not lexemes[-1]:
+            lexemes.pop()
+        lexeme_tokens = self.lexeme_tokens
+        # each distinct lexeme is classified once; every occurrence is then a dict lookup
+        for lexeme in set(lexemes).difference(lexeme_tokens):
+            lexeme_tokens[lexeme] = self.new_token(lexeme)
+        tokens = list(map(lexeme_tokens.__getitem__, lexemes))
+        if self.had_error:
+            self.report_errors()
+            tokens = [token for token in tokens if token is not None]
+        tokens.append(EOF_TOKEN)
+        return tokens, self.had_error
 
-        while self.current < len(self.source_code):
-            self.current += 1
-            char = self.source_code[self.current - 1]
-            if char == "(":
-                tokens.append(Token("LEFT_PAREN", "(", None))
-            elif char == ")":
-                tokens.append(Token("RIGHT_PAREN", ")", None))
-            elif char == "{":
-                tokens.append(Token("LEFT_BRACE", "{", None))
-            elif char == "}":
-                tokens.append(Token("RIGHT_BRACE", "}", None))
-            elif char == "*":
-                tokens.append(Token("STAR", "*", None))
-            elif char == ".":
-                tokens.append(Token("DOT", ".", None))
-            elif char == ",":
-                tokens.append(Token("COMMA", ",", None))
-            elif char == "+":
-                tokens.append(Token("PLUS", "+", None))
-            elif char == "-":
-                tokens.append(Token("MINUS", "-", None))
-            elif char == ";":
-                tokens.append(Token("SEMICOLON", ";", None))
-            elif char == "/":
-                # slash can either be division or a comment
-                if self.current < len(self.source_code) and self.source_code[self.current] == "/":
-                    while self.current < len(self.source_code) and self.source_code[self.current] != "\n":
-                        self.current += 1
-                else:
-                    tokens.append(Token("SLASH", "/", None))
-
-            elif char == "=":
-                if self.current < len(self.source_code) and self.source_code[self.current] == "=":
-                    tokens.append(Token("EQUAL_EQUAL", "==", None))
-                    self.current += 1
-                else:
-                    tokens.append(Token("EQUAL", "=", None))
-            elif char == "!":
-                if self.current < len(self.source_code) and self.source_code[self.current] == "=":
-                    tokens.append(Token("BANG_EQUAL", "!=", None))
-                    self.current += 1
-                else:
-                    tokens.append(Token("BANG", "!", None))
-            elif char == "<":
-                if self.current < len(self.source_code) and self.source_code[self.current] == "=":
-                    tokens.append(Token("LESS_EQUAL", "<=", None))
-                    self.current += 1
-                else:
-                    tokens.append(Token("LESS", "<", None))
-            elif char == ">":
-                if self.current < len(self.source_code) and self.source_code[self.current] == "=":
-                    tokens.append(Token("GREATER_EQUAL", ">=", None))
-                    self.current += 1
-                else:
-                    tokens.append(Token("GREATER", ">", None))
-            elif char == "\"":
-                string_start = self.current
-                while self.current < len(self.source_code) and self.source_code[self.current] != '"':
-                    self.current += 1
-                if self.current >= len(self.source_code):
-                    print(f"[line {self.line}] Error: Unterminated string.", file=sys.stderr)
-                    self.had_error = True
-                    continue
-                self.current += 1
-                string_end = self.current - 1
-                string_literal = self.source_code[string_start:string_end]
-                tokens.append(Token("STRING", f'"{string_literal}"', string_literal))
-            elif char.isdigit():
-                number_start = self.current - 1
-                while self.current < len(self.source_code) and (self.source_code[self.current].isdigit() or self.source_code[self.current] == "."):
-                    self.current += 1
-                number_end = self.current
-                number_literal = self.source_code[number_start:number_end]
-                tokens.append(Token("NUMBER", number_literal, float(number_literal)))
-            elif char.isalpha() or char == "_":
-                identifier_start = self.current - 1
-                while self.current < len(self.source_code) and (self.source_code[self.current].isalnum() or self.source_code[self.current] == "_"):
-                    self.current += 1
-                identifier_end = self.current
-                identifier_literal = self.source_code[identifier_start:identifier_end]
-                if identifier_literal in ["and", "class", "else", "false", "for", "fun", "if", "nil", "or", "print", "return", "super", "this", "true", "var", "while"]:
-                    # reserved words
-                    tokens.append(Token(identifier_literal.upper(), identifier_literal, None))
-                else:
-                    tokens.append(Token("IDENTIFIER", identifier_literal, None))
-            elif char == " ":
-                pass
-            elif char == "\t":
-                pass
-            elif char == "\r":
-                pass
-            elif char == "\f":
-                pass
-            elif char == "\n":
-                self.line += 1
+    def new_token(self, lexeme):
+        char = lexeme[0]
+        if char in IDENTIFIER_START:
+            return Token(TokenType.IDENTIFIER, lexeme.decode("ascii"), None)
+        if char in DIGITS:
+            # float() parses ascii bytes directly, independent of the decoded lexeme
+            return Token(TokenType.NUMBER, lexeme.decode("ascii"), float(lexeme))
+        if char == 0x22 and len(lexeme) > 1 and lexeme[-1] == 0x22: # "
+            # the lexeme keeps its quotes; decoding it once and slicing is cheaper than re-quoting the literal
+            string_lexeme = lexeme.decode("utf-8")
+            return Token(TokenType.STRING, string_lexeme, string_lexeme[1:-1])
+        self.had_error = True
+        return None
+
+    def report_errors(self):
+        # errors are rare, so their positions are recovered with a second, slower pass
+        src = self.source_code
+        lexeme_tokens = self.lexeme_tokens
+        for match in TOKEN_PATTERN.finditer(src):
+            lexeme = match.group(1)
+            if not lexeme or lexeme_tokens[lexeme] is not None:
+                continue
+            if lexeme[0] == 0x22: # "
+                # the error is reported where the scan stops, at the end of the file
+                print(f"[line {self.line_at(len(src))}] Error: Unterminated string.", file=sys.stderr)
             else:
-                print(f"[line {self.line}] Error: Unexpected character: {char}", file=sys.stderr)
-                self.had_error = True
-                
-        tokens.append(Token("EOF", "", None))
-        return tokens, self.had_error
+                character = lexeme.decode("utf-8", errors="replace")
+                print(f"[line {self.line_at(match.start(1))}] Error: Unexpected character: {character}", file=sys.stderr)
+
+    def line_at(self, position):
+        newline_positions = self.newline_positions
+        if newline_positions is None:
+            newline_positions = self.newline_positions = [match.start() for match in NEWLINE.finditer(self.source_code)]
+        return bisect_left(newline_positions, position) + 1
     
 
 class Expression(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def __str__(self) -> str:
         pass
@@ -136,6 +221,8 @@ class Expression(ABC):
         pass
 
 class LiteralExpression(Expression):
+    __slots__ = ("value",)
+
     def __init__(self, value) -> None:
         self.value = value
 
@@ -149,19 +236,28 @@ class LiteralExpression(Expression):
         return self.value
     
 class VariableExpression(Expression):
-    def __init__(self, name: str):
+    __slots__ = ("name", "depth", "slot")
+
+    # depth counts enclosing blocks between the use and the declaration; None means a global
+    def __init__(self, name: str, depth: int | None = None, slot: int | None = None):
         self.name = name
+        self.depth = depth
+        self.slot = slot
 
     def evaluate(self):
-        if self.name not in ENVIRONMENT:
+        if self.depth is not None:
+            return FRAMES[-1 - self.depth][self.slot]
+        if self.name not in GLOBALS:
             print(f"Undefined variable '{self.name}'", file=sys.stderr)
             exit(70)
-        return ENVIRONMENT[self.name]
+        return GLOBALS[self.name]
     
     def __str__(self) -> str:
         return f"(identifier {self.name})"
     
 class GroupExpression(Expression):
+    __slots__ = ("expression",)
+
     def __init__(self, expression: Expression) -> None:
         self.expression = expression
 
@@ -172,6 +268,8 @@ class GroupExpression(Expression):
         return self.expression.evaluate()
     
 class UnaryExpression(Expression):
+    __slots__ = ("operator", "expression")
+
     def __init__(self, operator: Token, expression: Expression) -> None:
         self.operator = operator
         self.expression = expression
@@ -181,8 +279,8 @@ class UnaryExpression(Expression):
 
     def evaluate(self):
         value = self.expression.evaluate()
-        if self.operator.type == "MINUS":
-            if not isinstance(value, float):
+        if self.operator.type == TokenType.MINUS:
+            if value.__class__ is not float:
                 print(f"Operand must be a number.", file=sys.stderr)
                 exit(70)
             return -1 * value
@@ -190,182 +288,211 @@ class UnaryExpression(Expression):
             return not value
 
 
+def number_operands_error():
+    print("Operands must be numbers.", file=sys.stderr)
+    exit(70)
+
+def binary_plus(left_value, right_value):
+    operand_type = left_value.__class__
+    if operand_type is not right_value.__class__ or (operand_type is not float and operand_type is not str):
+        print("Operands must be two numbers or two strings.", file=sys.stderr)
+        exit(70)
+    return left_value + right_value
+
+def binary_minus(left_value, right_value):
+    if left_value.__class__ is not float or right_value.__class__ is not float:
+        number_operands_error()
+    return left_value - right_value
+
+def binary_star(left_value, right_value):
+    if left_value.__class__ is not float or right_value.__class__ is not float:
+        number_operands_error()
+    return left_value * right_value
+
+def binary_slash(left_value, right_value):
+    if left_value.__class__ is not float or right_value.__class__ is not float:
+        number_operands_error()
+    return left_value / right_value
+
+def binary_bang_equal(left_value, right_value):
+    return left_value != right_value
+
+def binary_equal_equal(left_value, right_value):
+    return left_value == right_value
+
+def binary_greater(left_value, right_value):
+    if left_value.__class__ is not float or right_value.__class__ is not float:
+        number_operands_error()
+    return left_value > right_value
+
+def binary_greater_equal(left_value, right_value):
+    if left_value.__class__ is not float or right_value.__class__ is not float:
+        number_operands_error()
+    return left_value >= right_value
+
+def binary_less(left_value, right_value):
+    if left_value.__class__ is not float or right_value.__class__ is not float:
+        number_operands_error()
+    return left_value < right_value
+
+def binary_less_equal(left_value, right_value):
+    if left_value.__class__ is not float or right_value.__class__ is not float:
+        number_operands_error()
+    return left_value <= right_value
+
+BINARY_OPERATORS = {
+    TokenType.PLUS: binary_plus,
+    TokenType.MINUS: binary_minus,
+    TokenType.STAR: binary_star,
+    TokenType.SLASH: binary_slash,
+    TokenType.BANG_EQUAL: binary_bang_equal,
+    TokenType.EQUAL_EQUAL: binary_equal_equal,
+    TokenType.GREATER: binary_greater,
+    TokenType.GREATER_EQUAL: binary_greater_equal,
+    TokenType.LESS: binary_less,
+    TokenType.LESS_EQUAL: binary_less_equal,
+}
+
 class BinaryExpression(Expression):
+    __slots__ = ("operator", "left", "right", "operation")
+
     def __init__(self, operator: Token, left: Expression, right: Expression):
         self.operator = operator
         self.left = left
         self.right = right
+        # resolved once here so evaluation never dispatches on the operator type
+        self.operation = BINARY_OPERATORS[operator.type]
 
     def __str__(self) -> str:
         return f"({self.operator.lexeme} {self.left} {self.right})"
     
     def evaluate(self):
-        left_value = self.left.evaluate()
-        right_value = self.right.evaluate()
-        if self.operator.type == "PLUS":
-            if not isinstance(left_value, (float, str)) or not isinstance(right_value, (float, str)) or type(left_value) != type(right_value):
-                print("Operands must be two numbers or two strings.", file=sys.stderr)
-                exit(70)
-            return left_value + right_value
-        if self.operator.type == "MINUS":
-            if not isinstance(left_value, float) or not isinstance(right_value, float):
-                print("Operands must be numbers.", file=sys.stderr)
-                exit(70)
-
-            return left_value - right_value
-        if self.operator.type == "STAR":
-            if not isinstance(left_value, float) or not isinstance(right_value, float):
-                print("Operands must be numbers.", file=sys.stderr)
-                exit(70)
-            return left_value * right_value
-        if self.operator.type == "SLASH":
-            if not isinstance(left_value, float) or not isinstance(right_value, float):
-                print("Operands must be numbers.", file=sys.stderr)
-                exit(70)
-            return left_value / right_value
-        if self.operator.type == "BANG_EQUAL":
-            return left_value != right_value
-        if self.operator.type == "EQUAL_EQUAL":
-            return left_value == right_value
-        if self.operator.type == "GREATER":
-            if not isinstance(left_value, float) or not isinstance(right_value, float):
-                print("Operands must be numbers.", file=sys.stderr)
-                exit(70)
-
-            return left_value > right_value
-        if self.operator.type == "GREATER_EQUAL":
-            if not isinstance(left_value, float) or not isinstance(right_value, float):
-                print("Operands must be numbers.", file=sys.stderr)
-                exit(70)
-
-            return left_value >= right_value
-        if self.operator.type == "LESS":
-            if not isinstance(left_value, float) or not isinstance(right_value, float):
-                print("Operands must be numbers.", file=sys.stderr)
-                exit(70)
-
-            return left_value < right_value
-        if self.operator.type == "LESS_EQUAL":
-            if not isinstance(left_value, float) or not isinstance(right_value, float):
-                print("Operands must be numbers.", file=sys.stderr)
-                exit(70)
-
-            return left_value <= right_value
+        return self.operation(self.left.evaluate(), self.right.evaluate())
 
 class AssignmentExpression(Expression):
-    def __init__(self, name, expression):
+    __slots__ = ("name", "expression", "depth", "slot")
+
+    def __init__(self, name, expression, depth=None, slot=None):
         self.name = name
         self.expression = expression
+        self.depth = depth
+        self.slot = slot
 
     def __str__(self) -> str:
         return f"(assignment {self.name} {self.expression})"
 
     def evaluate(self):
-        ENVIRONMENT[self.name] = self.expression.evaluate()
-        return ENVIRONMENT[self.name]
+        value = self.expression.evaluate()
+        if self.depth is None:
+            GLOBALS[self.name] = value
+        else:
+            FRAMES[-1 - self.depth][self.slot] = value
+        return value
+
+# binding power of each binary operator; higher binds tighter, all are left-associative
+BINARY_PRECEDENCE = {
+    TokenType.BANG_EQUAL: 1,
+    TokenType.EQUAL_EQUAL: 1,
+    TokenType.GREATER: 2,
+    TokenType.GREATER_EQUAL: 2,
+    TokenType.LESS: 2,
+    TokenType.LESS_EQUAL: 2,
+    TokenType.PLUS: 3,
+    TokenType.MINUS: 3,
+    TokenType.STAR: 4,
+    TokenType.SLASH: 4,
+}
+UNARY_OPERATORS = frozenset((TokenType.BANG, TokenType.MINUS))
+LITERAL_TOKEN_TYPES = frozenset((TokenType.NUMBER, TokenType.STRING))
+KEYWORD_VALUES = {
+    TokenType.TRUE: True,
+    TokenType.FALSE: False,
+    TokenType.NIL: None,
+}
 
 class Parser:
     def __init__(self, tokens):
         self.tokens = tokens
         self.current = 0
+        # one name -> slot map per enclosing block, innermost last; empty at the top level where names are global
+        self.scopes = []
+
+    def resolve(self, name):
+        scopes = self.scopes
+        # top-level code has no enclosing block, so every name there is a global
+        if not scopes:
+            return None, None
+        depth = 0
+        for scope in reversed(scopes):
+            slot = scope.get(name)
+            if slot is not None:
+                return depth, slot
+            depth += 1
+        return None, None
+
+    def declare(self, name):
+        if not self.scopes:
+            return None
+        scope = self.scopes[-1]
+        return scope.setdefault(name, len(scope))
 
     def parse_primary(self):
         self.current += 1
         token = self.tokens[self.current - 1]
-        if token.type == "TRUE":
-            return LiteralExpression(True)
-        if token.type == "FALSE":
-            return LiteralExpression(False)
-        if token.type == "NIL":
-            return LiteralExpression(None)
-        if token.type in ["NUMBER", "STRING"]:
+        token_type = token.type
+        # most common first: literals and names vastly outnumber keywords and groups
+        if token_type in LITERAL_TOKEN_TYPES:
             return LiteralExpression(token.literal)
-        if token.type == "LEFT_PAREN":
+        if token_type == TokenType.IDENTIFIER:
+            return VariableExpression(token.lexeme, *self.resolve(token.lexeme))
+        if token_type in KEYWORD_VALUES:
+            return LiteralExpression(KEYWORD_VALUES[token_type])
+        if token_type == TokenType.LEFT_PAREN:
             expression = self.parse_expression()
-            self.consume("RIGHT_PAREN")
+            self.consume(TokenType.RIGHT_PAREN)
             return GroupExpression(expression)
-        if token.type == "IDENTIFIER":
-            return VariableExpression(token.lexeme)
         
         print(f"Error at {token.lexeme}: Expect expression.", file=sys.stderr)
         exit(65)
 
     def parse_assignment(self):
-        expression = self.parse_equality()
-
-        if self.current < len(self.tokens):
-            token = self.tokens[self.current]
-            if token.type == "EQUAL":
-                self.current += 1
-
-                if isinstance(expression, VariableExpression):
-                    right = self.parse_assignment()
-                    return AssignmentExpression(expression.name, right)
-
-        return expression
-
-    def parse_equality(self):
-        expression = self.parse_comparison()
+        expression = self.parse_binary()
 
-        while self.current < len(self.tokens):
-            token = self.tokens[self.current]
-            if token.type not in ["BANG_EQUAL", "EQUAL_EQUAL"]:
-                break
+        token = self.tokens[self.current]
+        if token.type == TokenType.EQUAL:
             self.current += 1
-            right = self.parse_comparison()
-            expression = BinaryExpression(token, expression, right)
-        
-        return expression
-
-    def parse_comparison(self):
-        expression = self.parse_term()
 
-        while self.current < len(self.tokens):
-            token = self.tokens[self.current]
-            if token.type not in ["GREATER", "GREATER_EQUAL", "LESS", "LESS_EQUAL"]:
-                break
-            self.current += 1
-            right = self.parse_term()
-            expression = BinaryExpression(token, expression, right)
+            if isinstance(expression, VariableExpression):
+                right = self.parse_assignment()
+                return AssignmentExpression(expression.name, right, expression.depth, expression.slot)
 
         return expression
 
-
-    def parse_term(self):
-        expression = self.parse_factor()
-
-        while self.current < len(self.tokens):
-            token = self.tokens[self.current]
-            if token.type not in ["PLUS", "MINUS"]:
-                break
-            self.current += 1
-            right = self.parse_factor()
-            left = expression
-            expression = BinaryExpression(token, left, right)
-
-        return expression
-        
-    def parse_factor(self):
+    def parse_binary(self, min_precedence=1):
         expression = self.parse_unary()
 
-        while self.current < len(self.tokens):
-            token = self.tokens[self.current]
-            if token.type not in ["STAR", "SLASH"]:
+        tokens = self.tokens
+        while True:
+            token = tokens[self.current]
+            precedence = BINARY_PRECEDENCE.get(token.type, 0)
+            if precedence < min_precedence:
                 break
             self.current += 1
-            right = self.parse_unary()
-            left = expression
-            expression = BinaryExpression(token, left, right)
+            right = self.parse_binary(precedence + 1)
+            expression = BinaryExpression(token, expression, right)
 
         return expression
         
     def parse_unary(self):
-        token = self.tokens[self.current]
-        if token.type in ["BANG", "MINUS"]:
+        tokens = self.tokens
+        operators = []
+        while tokens[self.current].type in UNARY_OPERATORS:
+            operators.append(tokens[self.current])
             self.current += 1
-            expression = self.parse_unary()
-            return UnaryExpression(token, expression)
-        return self.parse_primary()
+        expression = self.parse_primary()
+        for operator in reversed(operators):
+            expression = UnaryExpression(operator, expression)
+        return expression
 
 
     def parse_expression(self):
@@ -374,46 +501,49 @@ class Parser:
 
     def parse_statements(self):
         statements = []
-        while self.tokens[self.current].type != "EOF":
+        while self.tokens[self.current].type != TokenType.EOF:
             statement = self.parse_statement()
             statements.append(statement)
         return statements
 
     def parse_statement(self):
         token = self.tokens[self.current] 
-        if token.type == "PRINT":
+        if token.type == TokenType.PRINT:
             self.current += 1
             expression = self.parse_expression()
-            self.consume("SEMICOLON")
+            self.consume(TokenType.SEMICOLON)
             return PrintStatement(expression)
         
-        if token.type == "VAR":
+        if token.type == TokenType.VAR:
             self.current += 1
-            identifer = self.consume("IDENTIFIER")
-            if not self.tokens[self.current].type == "EQUAL":
-                self.consume("SEMICOLON")
-                return VariableDeclarationStatement(identifer.lexeme, None)
+            identifer = self.consume(TokenType.IDENTIFIER)
+            if not self.tokens[self.current].type == TokenType.EQUAL:
+                self.consume(TokenType.SEMICOLON)
+                return VariableDeclarationStatement(identifer.lexeme, None, self.declare(identifer.lexeme))
 
             self.current += 1
+            # the initializer is resolved before the name is declared, so it still sees any outer variable of the same name
             expression = self.parse_expression()
-            self.consume("SEMICOLON")
-            return VariableDeclarationStatement(identifer.lexeme, expression)
+            self.consume(TokenType.SEMICOLON)
+            return VariableDeclarationStatement(identifer.lexeme, expression, self.declare(identifer.lexeme))
         
-        if token.type == "LEFT_BRACE":
+        if token.type == TokenType.LEFT_BRACE:
             self.current += 1
-            return BlockStatement(self.parse_block())
+            self.scopes.append({})
+            statements = self.parse_block()
+            return BlockStatement(statements, len(self.scopes.pop()))
 
         expression = self.parse_expression()
-        self.consume("SEMICOLON");
+        self.consume(TokenType.SEMICOLON);
         return ExpressionStatement(expression)
     
     def parse_block(self):
         statements = []
 
-        while self.current < len(self.tokens) and self.tokens[self.current].type != "RIGHT_BRACE":
+        while self.current < len(self.tokens) and self.tokens[self.current].type != TokenType.RIGHT_BRACE:
             statements.append(self.parse_statement())
         
-        self.consume("RIGHT_BRACE")
+        self.consume(TokenType.RIGHT_BRACE)
         return statements
 
     def consume(self, type):
@@ -421,17 +551,21 @@ class Parser:
             self.current += 1
             return self.tokens[self.current - 1]
         
-        print(f"Error at {self.tokens[self.current - 1].lexeme}: Expected {type}.", file=sys.stderr)
+        print(f"Error at {self.tokens[self.current - 1].lexeme}: Expected {TOKEN_TYPE_NAMES[type]}.", file=sys.stderr)
         exit(65)
     
 
 
 class Statement(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def execute(self): pass
 
 
 class PrintStatement(Statement):
+    __slots__ = ("expression",)
+
     def __init__(self, expression: Expression):
         self.expression = expression
 
@@ -439,6 +573,8 @@ class PrintStatement(Statement):
         print(lox_representation(self.expression.evaluate()))
 
 class ExpressionStatement(Statement):
+    __slots__ = ("expression",)
+
     def __init__(self, expression: Expression):
         self.expression = expression
     
@@ -446,27 +582,33 @@ class ExpressionStatement(Statement):
         self.expression.evaluate()
 
 class VariableDeclarationStatement(Statement):
-    def __init__(self, name: str, expression: Expression | None):
+    __slots__ = ("expression", "name", "slot")
+
+    # slot is the variable's index in the innermost frame; None declares a global
+    def __init__(self, name: str, expression: Expression | None, slot: int | None = None):
         self.expression = expression
         self.name = name
+        self.slot = slot
     
     def execute(self):
-        if self.expression is None:
-            ENVIRONMENT[self.name] = None
+        value = None if self.expression is None else self.expression.evaluate()
+        if self.slot is None:
+            GLOBALS[self.name] = value
         else:
-            ENVIRONMENT[self.name] = self.expression.evaluate()
+            FRAMES[-1][self.slot] = value
 
 class BlockStatement(Statement):
-    def __init__(self, statements: list[Statement]):
+    __slots__ = ("statements", "slot_count")
+
+    def __init__(self, statements: list[Statement], slot_count: int):
         self.statements = statements
+        self.slot_count = slot_count
 
     def execute(self):
-        global ENVIRONMENT
-        parent_environment = ENVIRONMENT
-        ENVIRONMENT = {**parent_environment}  # this ensures lexical scoping
+        FRAMES.append([None] * self.slot_count)
         for statement in self.statements:
             statement.execute()
-        ENVIRONMENT = parent_environment
+        FRAMES.pop()
 
 def lox_representation(value):
     if value is True:
@@ -481,6 +623,16 @@ def lox_representation(value):
         return int(value)
     return value
 
+def scan_file(filename):
+    with open(filename, "rb") as file:
+        status = os.fstat(file.fileno())
+        # mmap rejects empty files and can't map pipes or other non-regular files; read those instead
+        if not stat.S_ISREG(status.st_mode) or status.st_size == 0:
+            return Scanner(file.read()).scan()
+        # scan straight out of the page cache; tokens keep their own decoded copies, so the map can close afterwards
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as source_code:
+            return Scanner(source_code).scan()
+
 def main():
     if len(sys.argv) < 3:
         print("Usage: ./your_program.sh tokenize <filename>", file=sys.stderr)
@@ -490,43 +642,35 @@ def main():
     filename = sys.argv[2]
 
     if command == "tokenize":
-        with open(filename) as file:
-            file_contents = file.read()
-            tokens, had_error = Scanner(file_contents).scan()
-            for token in tokens:
-                print(token)
-            if had_error:
-                exit(65)
-            return
+        tokens, had_error = scan_file(filename)
+        # one write for the whole listing instead of a print() per token
+        sys.stdout.write("\n".join(map(repr, tokens)) + "\n")
+        if had_error:
+            exit(65)
+        return
         
     if command == "parse":
-        with open(filename) as file:
-            file_contents = file.read()
-            tokens, had_error = Scanner(file_contents).scan()
-            if had_error:
-                exit(65)
-            expression = Parser(tokens).parse_expression()
-            print(expression)
-            return
+        tokens, had_error = scan_file(filename)
+        if had_error:
+            exit(65)
+        expression = Parser(tokens).parse_expression()
+        print(expression)
+        return
 
     if command == "evaluate":
-        with open(filename) as file:
-            file_contents = file.read()
-            tokens, had_error = Scanner(file_contents).scan()
-            if had_error: exit(65)
-            expression = Parser(tokens).parse_expression()
-            print(lox_representation(expression.evaluate()))
-            return
+        tokens, had_error = scan_file(filename)
+        if had_error: exit(65)
+        expression = Parser(tokens).parse_expression()
+        print(lox_representation(expression.evaluate()))
+        return
         
     if command == "run":
-        with open(filename) as file:
-            file_contents = file.read()
-            tokens, had_error = Scanner(file_contents).scan()
-            if had_error: exit(65)
-            statements = Parser(tokens).parse_statements()
-            for statement in statements:
-                statement.execute()
-            return
+        tokens, had_error = scan_file(filename)
+        if had_error: exit(65)
+        statements = Parser(tokens).parse_statements()
+        for statement in statements:
+            statement.execute()
+        return
 
     
 